@@ -1,30 +1,202 @@
+import atexit
+import base64
+import functools
+import hashlib
+import hmac
 import json
 import os
+import re
+import shutil
+import sys
+import time
+import uuid
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
 from datetime import datetime
+from urllib.parse import quote, unquote
+
+try:
+    import orjson
+except ImportError:  # optional accelerator; fall back to the standard library
+    orjson = None
 
 USERS_FILE = 'users.json'
-INBOX_FILE = 'inboxes.json'
+MAILBOX_DIR = 'mailboxes'
+MESSAGES_FILE = 'messages.jsonl'
+# Single-document files used before the logs; imported once if no mailbox logs exist yet.
+LEGACY_INBOX_FILE = 'inboxes.json'
+LEGACY_MESSAGES_FILE = 'messages.json'
+WRITE_BUFFER_SIZE = 1 << 16
+# A log is rewritten once it holds this many more lines than it has live entries.
+COMPACT_EVERY = 1000
+HASH_SCHEME = 'pbkdf2_sha256'
+HASH_ITERATIONS = 200_000
+
+# Set whenever users change in memory; cleared by flush().
+_dirty = False
+
+# Encoded log lines waiting to be appended by flush(), keyed by log file path.
+_pending: dict[str, list[bytes]] = {}
+
+# Number of lines currently stored in each log file on disk.
+_log_lines: dict[str, int] = {}
+
+# Lowercased (subject, body) per message id, computed once and never saved.
+_lowered: dict[str, tuple[str, str]] = {}
+
+
+# -------------------- Email Record -------------------- #
+@dataclass(slots=True)
+class Email:
+    """
+    The content of a stored email, shared by every mailbox that references it.
+
+    Using __slots__ instead of a per-message dict keeps large mailboxes compact
+    in memory.
+
+    Attributes:
+        sender (str): The username of the sender.
+        to (list[str]): The usernames of the recipients.
+        subject (str): The subject line.
+        body (str): The message text.
+        time (int): The send (or compose) time in nanoseconds since the epoch.
+    """
+    sender: str
+    to: list[str]
+    subject: str
+    body: str
+    time: int
+
+    @classmethod
+    def from_dict(cls, data: dict) -> 'Email':
+        """
+        Builds an Email from its saved dictionary form.
+
+        Usernames are interned so every occurrence shares one string object.
+        Times saved by older versions as ISO 8601 strings are converted to
+        nanoseconds since the epoch.
+
+        Args:
+            data (dict): A dictionary with keys 'from', 'to', 'subject', 'body', and 'time'.
+
+        Returns:
+            Email: The email.
+        """
+        sent = data['time']
+        if isinstance(sent, str):
+            sent = int(datetime.fromisoformat(sent).timestamp() * 1e9)
+        return cls(sys.intern(data['from']), [sys.intern(name) for name in data['to']],
+                   data['subject'], data['body'], sent)
+
+    def to_dict(self) -> dict:
+        """
+        Returns the dictionary form used when saving the email.
+
+        Returns:
+            dict: A dictionary with keys 'from', 'to', 'subject', 'body', and 'time'.
+        """
+        return {'from': self.sender, 'to': self.to, 'subject': self.subject, 'body': self.body, 'time': self.time}
+
+
+# -------------------- Persistence -------------------- #
+def _json_default(obj: object) -> dict:
+    """
+    Converts objects the JSON encoders do not handle natively.
+
+    Args:
+        obj (object): The object to convert.
+
+    Returns:
+        dict: A JSON-serializable representation of the object.
+
+    Raises:
+        TypeError: If the object is not an Email.
+    """
+    if isinstance(obj, Email):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def encode_json(data: dict) -> bytes:
+    """
+    Serializes data to compact UTF-8 encoded JSON.
+
+    Uses orjson when it is installed, otherwise the standard json module.
+    Email objects are written as dictionaries with their on-disk key names.
+
+    Args:
+        data (dict): The data to serialize.
+
+    Returns:
+        bytes: The encoded JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(data, default=_json_default, option=orjson.OPT_PASSTHROUGH_DATACLASS)
+    return json.dumps(data, separators=(',', ':'), ensure_ascii=False, default=_json_default).encode('utf-8')
+
+
+def decode_json(raw: bytes) -> dict:
+    """
+    Parses a UTF-8 encoded JSON document.
+
+    Args:
+        raw (bytes): The encoded JSON document.
+
+    Returns:
+        dict: The parsed data.
+    """
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 
 def load_json(filename: str) -> dict:
     """
     Loads JSON data from a file.
 
+    The whole file is read as bytes in one call and parsed in memory.
+
     Args:
         filename (str): The path to the JSON file.
 
     Returns:
         dict: The data loaded from the JSON file. Returns an empty dictionary if the file does not exist.
     """
-    if os.path.exists(filename):
-        with open(filename, 'r') as f:
-            return json.load(f)
-    return {}
+    try:
+        with open(filename, 'rb') as f:
+            return decode_json(f.read())
+    except FileNotFoundError:
+        return {}
+
+
+def write_atomic(filename: str, payload: bytes) -> None:
+    """
+    Replaces a file's contents in one atomic step.
+
+    The payload is written with one call to a temporary file, which is synced
+    and then renamed over the target, so a crash mid-write never leaves a
+    truncated file behind.
+
+    Args:
+        filename (str): The path to the file.
+        payload (bytes): The new contents.
+
+    Returns:
+        None
+    """
+    tmp = filename + '.tmp'
+    with open(tmp, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, filename)
 
 
 def save_json(filename: str, data: dict) -> None:
     """
-    Saves data to a file in JSON format.
+    Saves data to a file in compact JSON format.
+
+    The data is serialized to a single bytes object and written atomically.
 
     Args:
         filename (str): The path to the JSON file.
@@ -33,17 +205,479 @@ def save_json(filename: str, data: dict) -> None:
     Returns:
         None
     """
-    with open(filename, 'w') as f:
-        json.dump(data, f, indent=4)
+    write_atomic(filename, encode_json(data))
+
+
+def read_log(path: str) -> Iterator[dict]:
+    """
+    Streams the records of an append-only JSON Lines log.
+
+    Records are parsed one line at a time. A final line without a newline is
+    the remains of an interrupted append; it is skipped and cut from the file
+    so later appends start on a clean line. Once exhausted, the number of
+    lines in the file is recorded for compaction.
+
+    Args:
+        path (str): The path to the log file.
+
+    Yields:
+        dict: Each record in the order it was written.
+    """
+    count = 0
+    offset = 0
+    torn = False
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.endswith(b'\n'):
+                    torn = True
+                    break
+                offset += len(line)
+                count += 1
+                yield decode_json(line)
+        if torn:
+            with open(path, 'r+b') as f:
+                f.truncate(offset)
+    _log_lines[path] = count
+
+
+def mailbox_path(username: str) -> str:
+    """
+    Returns the path of a user's mailbox log.
+
+    Args:
+        username (str): The owner of the mailbox.
+
+    Returns:
+        str: The log path. The username is hex encoded, so the name is filename-safe
+            and names differing only in case stay distinct on case-insensitive filesystems.
+    """
+    return os.path.join(MAILBOX_DIR, username.encode('utf-8').hex() + '.jsonl')
+
+
+def mailbox_owner(path: str) -> str:
+    """
+    Returns the username whose mailbox log is stored at a path.
+
+    Args:
+        path (str): The path to a mailbox log, as returned by mailbox_path.
+
+    Returns:
+        str: The owner of the mailbox.
+    """
+    return bytes.fromhex(os.path.basename(path)[:-len('.jsonl')]).decode('utf-8')
+
+
+def mailbox_name_owner(name: str) -> str | None:
+    """
+    Returns the owner of a mailbox log file name, if it is one.
+
+    Args:
+        name (str): A file name in the mailbox directory.
+
+    Returns:
+        str | None: The owner, or None if the name is not exactly the one mailbox_path gives.
+    """
+    if not name.endswith('.jsonl'):
+        return None
+    try:
+        owner = mailbox_owner(name)
+    except ValueError:
+        return None
+    return owner if os.path.basename(mailbox_path(owner)) == name else None
+
+
+def rename_legacy_mailboxes(directory: str) -> None:
+    """
+    Renames mailbox logs still named by the percent-encoded username.
+
+    Earlier versions named logs with the username percent-encoded, which keeps
+    its case; such logs are moved to the name returned by mailbox_path. A log
+    whose new name is already taken is left where it is.
+
+    Args:
+        directory (str): The directory holding the mailbox logs.
+
+    Returns:
+        None
+    """
+    for name in os.listdir(directory):
+        if not name.endswith('.jsonl') or mailbox_name_owner(name) is not None:
+            continue
+        stem = name[:-len('.jsonl')]
+        username = unquote(stem)
+        if quote(username, safe='') != stem:
+            continue
+        target = os.path.join(directory, os.path.basename(mailbox_path(username)))
+        if not os.path.exists(target):
+            os.replace(os.path.join(directory, name), target)
+
+
+def load_messages(filename: str) -> dict[str, Email]:
+    """
+    Loads the message table by replaying its log.
+
+    Each line holds a full message keyed by 'id'; a later line for the same id
+    replaces the earlier one. Ids are interned as they are parsed, so mailbox
+    references loaded afterwards share the table key's string object.
+
+    Args:
+        filename (str): The path to the message log.
+
+    Returns:
+        dict[str, Email]: The messages keyed by message id.
+    """
+    messages = {}
+    for record in read_log(filename):
+        messages[sys.intern(record['id'])] = Email.from_dict(record)
+    return messages
+
+
+def load_mailboxes(directory: str, messages: dict[str, Email]) -> dict[str, dict[str, list | bytearray]]:
+    """
+    Loads every user's mailbox by replaying the logs in a directory.
+
+    Mailbox logs contain 'add' records (append a message id to a folder),
+    'read_bits' records (replace the inbox read bitmap, base64 encoded) and
+    'del' records (remove a folder position). Logs written before the read
+    bitmap mark inbox entries read with a 'read' flag on 'add' records or with
+    'read' records (mark one inbox position read); both are still replayed.
+    '.jsonl' files whose names do not decode to a username are skipped with a
+    warning. References to messages missing from the message log are dropped
+    after replay, and the log is rewritten as a snapshot so later positional
+    records apply to the same folder layout.
+
+    Args:
+        directory (str): The directory holding one log per user, named by mailbox_path.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
+
+    Returns:
+        dict[str, dict[str, list | bytearray]]: The dictionary containing all user mailboxes.
+    """
+    inboxes = {}
+    if not os.path.isdir(directory):
+        return inboxes
+    rename_legacy_mailboxes(directory)
+    for name in os.listdir(directory):
+        if not name.endswith('.jsonl'):
+            continue
+        path = os.path.join(directory, name)
+        owner = mailbox_name_owner(name)
+        if owner is None:
+            print(f"Skipping {path}: not a mailbox log name.")
+            continue
+        box = new_mailbox()
+        for record in read_log(path):
+            if record['op'] == 'add':
+                box[record['box']].append(sys.intern(record['id']))
+                if record.get('read'):
+                    mark_read(box["read_bits"], len(box["inbox"]) - 1)
+            elif record['op'] == 'read_bits':
+                box["read_bits"] = bytearray(base64.b64decode(record['bits']))
+            elif record['op'] == 'read':
+                mark_read(box["read_bits"], record['index'])
+            elif record['op'] == 'del':
+                box[record['box']].pop(record['index'])
+                if record['box'] == 'inbox':
+                    drop_read_bit(box["read_bits"], record['index'])
+        dangling = False
+        inbox = box["inbox"]
+        for idx in reversed(range(len(inbox))):
+            if inbox[idx] not in messages:
+                del inbox[idx]
+                drop_read_bit(box["read_bits"], idx)
+                dangling = True
+        for folder in ("drafts", "sent"):
+            kept = [msg_id for msg_id in box[folder] if msg_id in messages]
+            if len(kept) != len(box[folder]):
+                box[folder] = kept
+                dangling = True
+        inboxes[sys.intern(owner)] = box
+        if dangling:
+            compact_log(path, inboxes, messages)
+    return inboxes
+
+
+def legacy_message_id(entry: str | dict, messages: dict[str, Email]) -> str:
+    """
+    Returns the message id for an entry of an old mailboxes file.
+
+    Entries are either message ids, inbox references {'msg_id', 'read'}, or,
+    in files written before messages were stored once, full message
+    dictionaries. A full message is added to the message table under a new id.
+
+    Args:
+        entry (str | dict): The folder entry.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
+
+    Returns:
+        str: The id of the entry's message.
+    """
+    if isinstance(entry, str):
+        return entry
+    if 'msg_id' in entry:
+        return entry['msg_id']
+    msg_id = uuid.uuid4().hex
+    messages[msg_id] = Email.from_dict(entry)
+    return msg_id
+
+
+def import_legacy_mail(inbox_file: str, messages_file: str) -> None:
+    """
+    Converts mail saved as single JSON documents into the log format.
+
+    The old message table is written out as the message log and every mailbox
+    as its own log snapshot, with inbox 'read' flags folded into the read bitmap.
+    Mailboxes that still embed full messages are split into the message table
+    and references. Older versions sorted the inbox and sent folders when
+    showing them, so those folders are sorted by time here, keeping each inbox
+    entry's read flag with its message. The mailbox logs are built in a temporary directory that
+    is renamed to the mailbox directory as the last step, so an interrupted
+    import leaves no mailbox directory behind and runs again on the next start.
+    The old files are left in place; they are ignored once the mailbox
+    directory exists.
+
+    Args:
+        inbox_file (str): The path to the old mailboxes file.
+        messages_file (str): The path to the old message table.
+
+    Returns:
+        None
+    """
+    messages = {msg_id: Email.from_dict(msg) for msg_id, msg in load_json(messages_file).items()}
+    inboxes = {}
+    for username, old_box in load_json(inbox_file).items():
+        box = new_mailbox()
+        inbox = [(legacy_message_id(entry, messages), entry.get("read", False)) for entry in old_box.get("inbox", [])]
+        inbox = sorted((ref for ref in inbox if ref[0] in messages), key=lambda ref: messages[ref[0]].time)
+        for idx, (msg_id, read) in enumerate(inbox):
+            box["inbox"].append(msg_id)
+            if read:
+                mark_read(box["read_bits"], idx)
+        box["drafts"] = [legacy_message_id(entry, messages) for entry in old_box.get("drafts", [])]
+        sent = [legacy_message_id(entry, messages) for entry in old_box.get("sent", [])]
+        box["sent"] = sorted((msg_id for msg_id in sent if msg_id in messages), key=lambda msg_id: messages[msg_id].time)
+        inboxes[username] = box
+    staging = MAILBOX_DIR + '.tmp'
+    shutil.rmtree(staging, ignore_errors=True)
+    os.makedirs(staging)
+    compact_log(MESSAGES_FILE, inboxes, messages)
+    for username in inboxes:
+        compact_log(os.path.join(staging, os.path.basename(mailbox_path(username))), inboxes, messages)
+    os.replace(staging, MAILBOX_DIR)
+
+
+def append_log(path: str, record: dict) -> None:
+    """
+    Queues a record to be appended to a log on the next flush.
+
+    Args:
+        path (str): The path to the log file.
+        record (dict): The record to append.
+
+    Returns:
+        None
+    """
+    _pending.setdefault(path, []).append(encode_json(record) + b'\n')
+
+
+def log_message(msg_id: str, msg: Email) -> None:
+    """
+    Queues a message's current content for the message log.
+
+    Args:
+        msg_id (str): The id of the message.
+        msg (Email): The message contents.
+
+    Returns:
+        None
+    """
+    append_log(MESSAGES_FILE, {'id': msg_id, **msg.to_dict()})
+
+
+def log_mailbox(username: str, record: dict) -> None:
+    """
+    Queues a change to a user's mailbox for their mailbox log.
+
+    Args:
+        username (str): The owner of the mailbox.
+        record (dict): The 'add', 'read_bits', or 'del' record describing the change.
+
+    Returns:
+        None
+    """
+    append_log(mailbox_path(username), record)
+
+
+def log_mailboxes(usernames: Iterable[str], record: dict) -> None:
+    """
+    Queues the same change for several users' mailbox logs, encoding it only once.
+
+    Args:
+        usernames (Iterable[str]): The owners of the mailboxes.
+        record (dict): The 'add', 'read_bits', or 'del' record describing the change.
+
+    Returns:
+        None
+    """
+    line = encode_json(record) + b'\n'
+    for username in usernames:
+        _pending.setdefault(mailbox_path(username), []).append(line)
+
+
+def compact_log(path: str, inboxes: dict[str, dict[str, list | bytearray]], messages: dict[str, Email]) -> None:
+    """
+    Rewrites a log as a snapshot of the current in-memory state.
+
+    The snapshot holds one line per live message or mailbox entry, replacing
+    all superseded, read, and deleted records. Compacting the message log also
+    drops messages no longer referenced by any mailbox.
+
+    Args:
+        path (str): The path to the log file.
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
+
+    Returns:
+        None
+    """
+    if path == MESSAGES_FILE:
+        prune_messages(inboxes, messages)
+        records = [{'id': msg_id, **msg.to_dict()} for msg_id, msg in messages.items()]
+    else:
+        box = inboxes[mailbox_owner(path)]
+        records = [{"op": "add", "box": folder, "id": msg_id}
+                   for folder in ("inbox", "drafts", "sent") for msg_id in box[folder]]
+        if any(box["read_bits"]):
+            records.append(read_bits_record(box["read_bits"]))
+    write_atomic(path, b''.join(encode_json(record) + b'\n' for record in records))
+    _log_lines[path] = len(records)
+
+
+def read_bits_record(read_bits: bytearray) -> dict:
+    """
+    Builds the mailbox log record that stores an inbox read bitmap.
+
+    Args:
+        read_bits (bytearray): The inbox read bitmap.
+
+    Returns:
+        dict: A 'read_bits' record with the bitmap base64 encoded.
+    """
+    return {"op": "read_bits", "bits": base64.b64encode(read_bits).decode('ascii')}
+
+
+def mark_dirty() -> None:
+    """
+    Records that user data has changed and users.json must be rewritten on the next flush.
+
+    Returns:
+        None
+    """
+    global _dirty
+    _dirty = True
+
+
+def flush(users: dict[str, str], inboxes: dict[str, dict[str, list | bytearray]], messages: dict[str, Email]) -> None:
+    """
+    Writes pending changes to disk.
+
+    users.json is rewritten only if it changed. Mailbox and message changes are
+    appended to their logs with one write per file, so the cost is proportional
+    to the changes rather than to all stored mail. A log that has grown
+    COMPACT_EVERY lines beyond its live entries is rewritten as a snapshot
+    instead. The message log is written first so mailboxes never reference a
+    message that is not on disk.
+
+    Args:
+        users (dict[str, str]): A dictionary of existing users with usernames as keys and password hashes as values.
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
+
+    Returns:
+        None
+    """
+    global _dirty
+    if _dirty:
+        save_json(USERS_FILE, users)
+        _dirty = False
+    if not _pending:
+        return
+    os.makedirs(MAILBOX_DIR, exist_ok=True)
+    for path in sorted(_pending, key=lambda p: p != MESSAGES_FILE):
+        lines = _pending[path]
+        if path == MESSAGES_FILE:
+            live = len(messages)
+        else:
+            box = inboxes[mailbox_owner(path)]
+            live = len(box["inbox"]) + len(box["drafts"]) + len(box["sent"])
+        if _log_lines.get(path, 0) + len(lines) >= live + COMPACT_EVERY:
+            compact_log(path, inboxes, messages)
+        else:
+            with open(path, 'ab') as f:
+                f.write(b''.join(lines))
+            _log_lines[path] = _log_lines.get(path, 0) + len(lines)
+    _pending.clear()
 
 
 # -------------------- User Functions -------------------- #
+def hash_password(password: str) -> str:
+    """
+    Hashes a password with PBKDF2-HMAC-SHA256 and a random salt.
+
+    Args:
+        password (str): The plaintext password.
+
+    Returns:
+        str: The stored form '<scheme>$<iterations>$<salt hex>$<hash hex>'.
+    """
+    salt = os.urandom(16)
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), salt, HASH_ITERATIONS)
+    return f"{HASH_SCHEME}${HASH_ITERATIONS}${salt.hex()}${digest.hex()}"
+
+
+def is_password_hashed(stored: str) -> bool:
+    """
+    Checks whether a stored password is a hash rather than legacy plaintext.
+
+    Args:
+        stored (str): The stored password entry.
+
+    Returns:
+        bool: True if the entry was produced by hash_password.
+    """
+    return stored.startswith(HASH_SCHEME + '$')
+
+
+@functools.lru_cache(maxsize=512)
+def verify_password(password: str, stored: str) -> bool:
+    """
+    Checks a password against its stored hash.
+
+    Hashing is deliberately slow, so results are cached per (password, stored
+    hash) pair; changing a password changes the stored hash and therefore the
+    cache key. Legacy plaintext entries are compared directly.
+
+    Args:
+        password (str): The plaintext password to check.
+        stored (str): The stored password entry.
+
+    Returns:
+        bool: True if the password matches.
+    """
+    if not is_password_hashed(stored):
+        return hmac.compare_digest(password.encode('utf-8'), stored.encode('utf-8'))
+    _, iterations, salt, digest = stored.split('$')
+    candidate = hashlib.pbkdf2_hmac('sha256', password.encode('utf-8'), bytes.fromhex(salt), int(iterations))
+    return hmac.compare_digest(candidate.hex(), digest)
+
+
 def register_user(users: dict[str, str]) -> None:
     """
     Registers a new user by prompting for a username and password.
 
     Args:
-        users (dict[str, str]): A dictionary of existing users with usernames as keys and passwords as values.
+        users (dict[str, str]): A dictionary of existing users with usernames as keys and password hashes as values.
 
     Returns:
         None
@@ -58,8 +692,8 @@ def register_user(users: dict[str, str]) -> None:
         else:
             break
     password = input("Choose a password: ").strip()
-    users[username] = password
-    save_json(USERS_FILE, users)
+    users[username] = hash_password(password)
+    mark_dirty()
     print(f"User '{username}' registered successfully!\n")
 
 
@@ -68,7 +702,7 @@ def login(users: dict[str, str]) -> str | None:
     Handles user login by verifying the username and password.
 
     Args:
-        users (dict[str, str]): A dictionary of existing users with usernames as keys and passwords as values.
+        users (dict[str, str]): A dictionary of existing users with usernames as keys and password hashes as values.
 
     Returns:
         str | None: The username of the logged-in user if successful, otherwise None.
@@ -85,7 +719,10 @@ def login(users: dict[str, str]) -> str | None:
             tries += 1
             continue
         password = input("Enter your password: ").strip()
-        if users[username] == password:
+        if verify_password(password, users[username]):
+            if not is_password_hashed(users[username]):
+                users[username] = hash_password(password)
+                mark_dirty()
             print(f"Login successful. Welcome, {username}!")
             return username
         else:
@@ -101,7 +738,7 @@ def change_password(username: str, users: dict[str, str]) -> None:
 
     Args:
         username (str): The username of the user changing their password.
-        users (dict[str, str]): A dictionary of existing users with usernames as keys and passwords as values.
+        users (dict[str, str]): A dictionary of existing users with usernames as keys and password hashes as values.
 
     Returns:
         None
@@ -110,36 +747,214 @@ def change_password(username: str, users: dict[str, str]) -> None:
     print("CHANGE PASSWORD".center(60))
     print("=" * 60)
     old_password = input("Enter your current password: ").strip()
-    if users.get(username) != old_password:
+    if not verify_password(old_password, users.get(username, '')):
         print("Incorrect password.")
         return
     new_password = input("Enter your new password: ").strip()
-    users[username] = new_password
-    save_json(USERS_FILE, users)
+    users[username] = hash_password(new_password)
+    mark_dirty()
     print("Password updated successfully.")
 
 
 # -------------------- Mailbox Structure -------------------- #
-def ensure_user_box(username: str, inboxes: dict[str, dict[str, list]]) -> None:
+def new_mailbox() -> dict[str, list | bytearray]:
+    """
+    Creates an empty mailbox.
+
+    'inbox', 'drafts' and 'sent' are lists of message ids. 'read_bits' is the
+    inbox read state as a bitmap: bit i (bit i & 7 of byte i >> 3) is set when
+    the message at inbox position i has been read.
+
+    Returns:
+        dict[str, list | bytearray]: The empty mailbox.
+    """
+    return {"inbox": [], "read_bits": bytearray(), "drafts": [], "sent": []}
+
+
+def is_read(read_bits: bytearray, index: int) -> bool:
+    """
+    Checks whether the inbox message at a position has been read.
+
+    Args:
+        read_bits (bytearray): The inbox read bitmap.
+        index (int): The inbox position.
+
+    Returns:
+        bool: True if the message has been read.
+    """
+    byte = index >> 3
+    return byte < len(read_bits) and bool(read_bits[byte] >> (index & 7) & 1)
+
+
+def mark_read(read_bits: bytearray, index: int) -> None:
+    """
+    Marks the inbox message at a position as read, growing the bitmap if needed.
+
+    Args:
+        read_bits (bytearray): The inbox read bitmap.
+        index (int): The inbox position.
+
+    Returns:
+        None
+    """
+    byte = index >> 3
+    if byte >= len(read_bits):
+        read_bits.extend(bytes(byte + 1 - len(read_bits)))
+    read_bits[byte] |= 1 << (index & 7)
+
+
+def drop_read_bit(read_bits: bytearray, index: int) -> None:
+    """
+    Removes the bit for a deleted inbox position, shifting later bits down by one.
+
+    Args:
+        read_bits (bytearray): The inbox read bitmap.
+        index (int): The deleted inbox position.
+
+    Returns:
+        None
+    """
+    bits = int.from_bytes(read_bits, 'little')
+    bits = (bits & ((1 << index) - 1)) | (bits >> (index + 1) << index)
+    read_bits[:] = bits.to_bytes(len(read_bits), 'little')
+
+
+def ensure_user_box(username: str, inboxes: dict[str, dict[str, list | bytearray]]) -> dict[str, list | bytearray]:
     """
     Ensures that the given username has an entry in the inboxes dictionary.
 
     If the username does not exist in the inboxes, it initializes the user's
-    mailbox structure with empty lists for 'inbox', 'drafts', and 'sent'.
+    mailbox structure with empty lists for 'inbox', 'drafts', and 'sent' and an
+    empty 'read_bits' bitmap.
 
     Args:
         username (str): The username to check or add to the inboxes.
-        inboxes (dict[str, dict[str, list]]): The dictionary containing all user mailboxes.
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
+
+    Returns:
+        dict[str, list | bytearray]: The user's mailbox.
+    """
+    box = inboxes.get(username)
+    if box is None:
+        box = inboxes[username] = new_mailbox()
+    return box
+
+
+def store_message(email: Email, messages: dict[str, Email]) -> str:
+    """
+    Stores an email's content in the shared message table.
+
+    Mailboxes only hold references to stored messages, so an email sent to many
+    recipients is kept (and saved) once.
+
+    Args:
+        email (Email): The email to store.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
+
+    Returns:
+        str: The id of the stored message.
+    """
+    msg_id = uuid.uuid4().hex
+    messages[msg_id] = email
+    log_message(msg_id, email)
+    lowered_text(msg_id, email)
+    return msg_id
+
+
+def deliver_message(msg_id: str, recipients: list[str], inboxes: dict[str, dict[str, list | bytearray]]) -> None:
+    """
+    Adds a stored message's id to each recipient's inbox as unread.
+
+    The message content is shared by all recipients; only the id is appended
+    per recipient, and its read bit starts cleared. Mailboxes are resolved in
+    one pass (a recipient listed twice gets the message once), then updated in
+    a batch: the log record is encoded once for all recipients.
+
+    Args:
+        msg_id (str): The id of the stored message.
+        recipients (list[str]): The usernames of the recipients.
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
 
     Returns:
         None
     """
-    if username not in inboxes:
-        inboxes[username] = {"inbox": [], "drafts": [], "sent": []}
+    boxes = {recipient: ensure_user_box(recipient, inboxes) for recipient in recipients}
+    for box in boxes.values():
+        box["inbox"].append(msg_id)
+    log_mailboxes(boxes, {"op": "add", "box": "inbox", "id": msg_id})
+
+
+def prune_messages(inboxes: dict[str, dict[str, list | bytearray]], messages: dict[str, Email]) -> None:
+    """
+    Removes messages that are no longer referenced by any inbox, draft, or sent folder.
+
+    Args:
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
+
+    Returns:
+        None
+    """
+    referenced = set()
+    for box in inboxes.values():
+        referenced.update(box["inbox"])
+        referenced.update(box["drafts"])
+        referenced.update(box["sent"])
+    for msg_id in messages.keys() - referenced:
+        del messages[msg_id]
+        _lowered.pop(msg_id, None)
+
+
+# -------------------- Search Text -------------------- #
+def lowered_text(msg_id: str, msg: Email) -> tuple[str, str]:
+    """
+    Returns the lowercased subject and body of a message, computing them only once.
+
+    Args:
+        msg_id (str): The id of the message.
+        msg (Email): The message contents.
+
+    Returns:
+        tuple[str, str]: The lowercased subject and body.
+    """
+    text = _lowered.get(msg_id)
+    if text is None:
+        text = _lowered[msg_id] = (msg.subject.lower(), msg.body.lower())
+    return text
 
 
 # -------------------- Mail Function -------------------- #
-def compose_email(sender: str) -> tuple[dict, list[str], str]:
+@functools.lru_cache(maxsize=4096)
+def _format_seconds(seconds: int) -> str:
+    """
+    Formats a whole number of seconds since the epoch, caching the result.
+
+    Args:
+        seconds (int): The time in seconds since the epoch.
+
+    Returns:
+        str: The local time in ISO 8601 format, to the second.
+    """
+    return datetime.fromtimestamp(seconds).isoformat(timespec='seconds')
+
+
+def format_time(timestamp: int) -> str:
+    """
+    Formats a message timestamp for display.
+
+    Timestamps are only formatted when printed, and each distinct second is
+    formatted once, so re-viewing a mailbox does not rebuild the strings.
+
+    Args:
+        timestamp (int): The time in nanoseconds since the epoch.
+
+    Returns:
+        str: The local time in ISO 8601 format, to the second.
+    """
+    return _format_seconds(timestamp // 1_000_000_000)
+
+
+def compose_email(sender: str) -> tuple[Email, list[str], str]:
     """
     Composes an email by prompting the user for recipients, subject, and body.
 
@@ -147,121 +962,130 @@ def compose_email(sender: str) -> tuple[dict, list[str], str]:
         sender (str): The username of the sender.
 
     Returns:
-        tuple[dict, list[str], str]: A tuple containing:
-            - The email as a dictionary with keys 'from', 'to', 'subject', 'body', 'time', and 'read'.
+        tuple[Email, list[str], str]: A tuple containing:
+            - The composed email.
             - A list of recipient usernames.
             - A string indicating the action ('send' or 'draft').
     """
     print("\n" + "=" * 60)
     print("COMPOSE EMAIL".center(60))
     print("=" * 60)
-    recipients = input("Recipients (comma separated): ").strip().split(",")
-    recipients = [r.strip() for r in recipients if r.strip()]
+    raw = input("Recipients (comma separated): ").split(",")
+    recipients = [name for r in raw if (name := r.strip())]
     subject = input("Subject: ").strip()
     body = input("Message:\n").strip()
-    time = datetime.now().isoformat(timespec='seconds')
-    email = {
-        'from': sender,
-        'to': recipients,
-        'subject': subject,
-        'body': body,
-        'time': time,
-        'read': False
-    }
+    email = Email(sender, recipients, subject, body, time.time_ns())
     action = input("Send now or save as draft? (send/draft): ").strip().lower()
     return email, recipients, action
 
 
-def send_email(sender: str, inboxes: dict[str, dict[str, list]]) -> None:
+def send_email(sender: str, inboxes: dict[str, dict[str, list | bytearray]], messages: dict[str, Email]) -> None:
     """
     Handles the process of composing and sending an email or saving it as a draft.
 
     Args:
         sender (str): The username of the sender.
-        inboxes (dict[str, dict[str, list]]): The dictionary containing all user mailboxes.
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
 
     Returns:
         None
     """
     email, recipients, action = compose_email(sender)
-    ensure_user_box(sender, inboxes)
+    box = ensure_user_box(sender, inboxes)
     if action == 'send':
-        for recipient in recipients:
-            ensure_user_box(recipient, inboxes)
-            inboxes[recipient]["inbox"].append(email.copy())
-        inboxes[sender]["sent"].append(email)
+        msg_id = store_message(email, messages)
+        deliver_message(msg_id, recipients, inboxes)
+        box["sent"].append(msg_id)
+        log_mailbox(sender, {"op": "add", "box": "sent", "id": msg_id})
         print(f"\nEmail sent to: {', '.join(recipients)}")
     elif action == 'draft':
-        inboxes[sender]["drafts"].append(email)
+        msg_id = store_message(email, messages)
+        box["drafts"].append(msg_id)
+        log_mailbox(sender, {"op": "add", "box": "drafts", "id": msg_id})
         print("Email saved to drafts.")
     else:
         print("Invalid option. Email not sent.")
 
 
-def view_inbox(username: str, inboxes: dict[str, dict[str, list[dict]]]) -> None:
+def view_inbox(username: str, inboxes: dict[str, dict[str, list | bytearray]], messages: dict[str, Email]) -> None:
     """
     Displays the inbox of the specified user.
 
     This function ensures the user's mailbox exists, retrieves the inbox,
-    and displays all emails sorted by time in ascending order. Marks emails
+    and displays all emails in ascending order of time. Marks emails
     as read after displaying them.
 
     Args:
         username (str): The username of the user whose inbox is to be viewed.
-        inboxes (dict[str, dict[str, list[dict]]]): The dictionary containing all user mailboxes.
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
 
     Returns:
         None
     """
-    ensure_user_box(username, inboxes)
-    inbox = inboxes[username]["inbox"]
+    box = ensure_user_box(username, inboxes)
+    inbox = box["inbox"]
+    read_bits = box["read_bits"]
     if not inbox:
         print("\nYour inbox is empty.")
         return
     print("\n" + "=" * 60)
     print(f"{username.upper()}'S INBOX".center(60))
     print("=" * 60)
-    sorted_inbox = sorted(inbox, key=lambda m: m['time'], reverse=False)
-    for idx, msg in enumerate(sorted_inbox):
-        status = "[NEW] " if not msg.get("read", False) else ""
-        print(f"\n[{idx}] {status}From: {msg['from']} | Time: {msg['time']}")
-        print(f"Subject: {msg['subject']}")
-        print(f"Message:\n{msg['body']}")
-        msg['read'] = True
-        print("-" * 60)
-
-
-def view_sent(username: str, inboxes: dict[str, dict[str, list[dict]]]) -> None:
+    # Messages are only ever appended with the current time, so the inbox is already chronological.
+    out = []
+    newly_read = False
+    for idx, msg_id in enumerate(inbox):
+        msg = messages[msg_id]
+        read = is_read(read_bits, idx)
+        status = "[NEW] " if not read else ""
+        out.append(f"\n[{idx}] {status}From: {msg.sender} | Time: {format_time(msg.time)}\n"
+                   f"Subject: {msg.subject}\n"
+                   f"Message:\n{msg.body}\n"
+                   f"{'-' * 60}\n")
+        if not read:
+            mark_read(read_bits, idx)
+            newly_read = True
+    sys.stdout.write("".join(out))
+    if newly_read:
+        log_mailbox(username, read_bits_record(read_bits))
+
+
+def view_sent(username: str, inboxes: dict[str, dict[str, list | bytearray]], messages: dict[str, Email]) -> None:
     """
     Displays the sent emails of the specified user.
 
     This function ensures the user's mailbox exists, retrieves the sent emails,
-    and displays all emails sorted by time in descending order.
+    and displays all emails in descending order of time.
 
     Args:
         username (str): The username of the user whose sent emails are to be viewed.
-        inboxes (dict[str, dict[str, list[dict]]]): The dictionary containing all user mailboxes.
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
 
     Returns:
         None
     """
-    ensure_user_box(username, inboxes)
-    sent = inboxes[username]["sent"]
+    sent = ensure_user_box(username, inboxes)["sent"]
     if not sent:
         print("\nNo sent messages.")
         return
     print("\n" + "=" * 60)
     print(f"{username.upper()}'S SENT MAILS".center(60))
     print("=" * 60)
-    sorted_sent = sorted(sent, key=lambda m: m['time'], reverse=True)
-    for idx, msg in enumerate(sorted_sent):
-        print(f"\n[{idx}] To: {', '.join(msg['to'])} | Time: {msg['time']}")
-        print(f"Subject: {msg['subject']}")
-        print(f"Message:\n{msg['body']}")
-        print("-" * 60)
-
-
-def view_drafts(username: str, inboxes: dict[str, dict[str, list[dict]]]) -> None:
+    # Sent mail is appended in send order, so newest-first is simply the reverse.
+    out = []
+    for idx, msg_id in enumerate(reversed(sent)):
+        msg = messages[msg_id]
+        out.append(f"\n[{idx}] To: {', '.join(msg.to)} | Time: {format_time(msg.time)}\n"
+                   f"Subject: {msg.subject}\n"
+                   f"Message:\n{msg.body}\n"
+                   f"{'-' * 60}\n")
+    sys.stdout.write("".join(out))
+
+
+def view_drafts(username: str, inboxes: dict[str, dict[str, list | bytearray]], messages: dict[str, Email]) -> None:
     """
     Displays the drafts of the specified user and allows sending or deleting drafts.
 
@@ -270,34 +1094,42 @@ def view_drafts(username: str, inboxes: dict[str, dict[str, list[dict]]]) -> Non
 
     Args:
         username (str): The username of the user whose drafts are to be viewed.
-        inboxes (dict[str, dict[str, list[dict]]]): The dictionary containing all user mailboxes.
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
 
     Returns:
         None
     """
-    ensure_user_box(username, inboxes)
-    drafts = inboxes[username]["drafts"]
+    box = ensure_user_box(username, inboxes)
+    drafts = box["drafts"]
     if not drafts:
         print("\nNo drafts saved.")
         return
     print("\n" + "=" * 60)
     print(f"{username.upper()}'S DRAFTS".center(60))
     print("=" * 60)
-    for idx, msg in enumerate(drafts):
-        print(f"\n[{idx}] To: {', '.join(msg.get('to', []))} | Time: {msg['time']}")
-        print(f"Subject: {msg['subject']}")
-        print(f"Message:\n{msg['body']}")
-        print("-" * 60)
+    out = []
+    for idx, msg_id in enumerate(drafts):
+        msg = messages[msg_id]
+        out.append(f"\n[{idx}] To: {', '.join(msg.to)} | Time: {format_time(msg.time)}\n"
+                   f"Subject: {msg.subject}\n"
+                   f"Message:\n{msg.body}\n"
+                   f"{'-' * 60}\n")
+    sys.stdout.write("".join(out))
 
     choice = input("Send or delete a draft? (send <index> / del <index> / cancel): ").strip()
     if choice.startswith("send"):
         try:
             index = int(choice.split()[1])
-            draft = drafts.pop(index)
-            for recipient in draft.get("to", []):
-                ensure_user_box(recipient, inboxes)
-                inboxes[recipient]["inbox"].append(draft.copy())
-            inboxes[username]["sent"].append(draft)
+            msg_id = drafts.pop(index)
+            log_mailbox(username, {"op": "del", "box": "drafts", "index": index})
+            # Stamp the send time so inboxes and sent mail stay in chronological order.
+            draft = messages[msg_id]
+            draft.time = time.time_ns()
+            log_message(msg_id, draft)
+            deliver_message(msg_id, draft.to, inboxes)
+            box["sent"].append(msg_id)
+            log_mailbox(username, {"op": "add", "box": "sent", "id": msg_id})
             print("Draft sent successfully!")
         except Exception:
             print("Invalid index.")
@@ -305,6 +1137,7 @@ def view_drafts(username: str, inboxes: dict[str, dict[str, list[dict]]]) -> Non
         try:
             index = int(choice.split()[1])
             drafts.pop(index)
+            log_mailbox(username, {"op": "del", "box": "drafts", "index": index})
             print("Draft deleted.")
         except Exception:
             print("Invalid index.")
@@ -312,7 +1145,7 @@ def view_drafts(username: str, inboxes: dict[str, dict[str, list[dict]]]) -> Non
         print("Cancelled.")
 
 
-def delete_email(username: str, inboxes: dict[str, dict[str, list[dict]]]) -> None:
+def delete_email(username: str, inboxes: dict[str, dict[str, list | bytearray]], messages: dict[str, Email]) -> None:
     """
     Deletes an email from the user's inbox.
 
@@ -321,47 +1154,57 @@ def delete_email(username: str, inboxes: dict[str, dict[str, list[dict]]]) -> No
 
     Args:
         username (str): The username of the user whose email is to be deleted.
-        inboxes (dict[str, dict[str, list[dict]]]): The dictionary containing all user mailboxes.
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
 
     Returns:
         None
     """
-    ensure_user_box(username, inboxes)
-    inbox = inboxes[username]["inbox"]
+    box = ensure_user_box(username, inboxes)
+    inbox = box["inbox"]
     if not inbox:
         print("\nNo emails to delete.")
         return
-    view_inbox(username, inboxes)
+    view_inbox(username, inboxes, messages)
     try:
         index = int(input("Enter the index of the message to delete: "))
         if 0 <= index < len(inbox):
             deleted = inbox.pop(index)
-            print(f"Deleted message from {deleted['from']}")
+            drop_read_bit(box["read_bits"], index)
+            log_mailbox(username, {"op": "del", "box": "inbox", "index": index})
+            print(f"Deleted message from {messages[deleted].sender}")
         else:
             print("Invalid index.")
     except ValueError:
         print("Please enter a valid number.")
 
 
-def search_emails(username: str, inboxes: dict[str, dict[str, list[dict]]]) -> None:
+def search_emails(username: str, inboxes: dict[str, dict[str, list | bytearray]], messages: dict[str, Email]) -> None:
     """
-    Searches for emails in the user's inbox that match a given keyword in the subject or body.
+    Searches for emails in the user's inbox that match any of the given keywords in the subject or body.
 
-    This function ensures the user's mailbox exists, prompts the user for a keyword,
-    and displays all matching emails. If no matches are found, it notifies the user.
+    This function ensures the user's mailbox exists, prompts the user for one or more
+    comma separated keywords, and displays all matching emails. If no matches are found,
+    it notifies the user. Each message's cached lowercase subject and body are scanned
+    with a single compiled pattern that matches all keywords in one pass.
 
     Args:
         username (str): The username of the user whose inbox is to be searched.
-        inboxes (dict[str, dict[str, list[dict]]]): The dictionary containing all user mailboxes.
+        inboxes (dict[str, dict[str, list | bytearray]]): The dictionary containing all user mailboxes.
+        messages (dict[str, Email]): The dictionary of message contents keyed by message id.
 
     Returns:
         None
     """
-    ensure_user_box(username, inboxes)
-    keyword = input("\nKeyword to search in subject/body: ").strip().lower()
+    inbox = ensure_user_box(username, inboxes)["inbox"]
+    raw = input("\nKeywords to search in subject/body (comma separated): ").lower().split(",")
+    keywords = [keyword for k in raw if (keyword := k.strip())] or [""]
+    pattern = re.compile("|".join(re.escape(k) for k in keywords))
     results = []
-    for idx, msg in enumerate(inboxes[username]["inbox"]):
-        if keyword in msg['subject'].lower() or keyword in msg['body'].lower():
+    for idx, msg_id in enumerate(inbox):
+        msg = messages[msg_id]
+        subject, body = lowered_text(msg_id, msg)
+        if pattern.search(subject) or pattern.search(body):
             results.append((idx, msg))
     if not results:
         print("No matching emails found.")
@@ -369,15 +1212,17 @@ def search_emails(username: str, inboxes: dict[str, dict[str, list[dict]]]) -> N
         print("\n" + "=" * 60)
         print("SEARCH RESULTS".center(60))
         print("=" * 60)
-        for idx, msg in results:
-            print(f"\n[{idx}] From: {msg['from']} | Time: {msg['time']}")
-            print(f"Subject: {msg['subject']}")
-            print(f"Message:\n{msg['body']}")
-            print("-" * 60)
+        sys.stdout.write("".join(
+            f"\n[{idx}] From: {msg.sender} | Time: {format_time(msg.time)}\n"
+            f"Subject: {msg.subject}\n"
+            f"Message:\n{msg.body}\n"
+            f"{'-' * 60}\n"
+            for idx, msg in results))
 
 
 # -------------------- menu -------------------- #
-def main_menu(current_user: str, users: dict[str, str], inboxes: dict[str, dict[str, list[dict]]]) -> None:
+def main_menu(current_user: str, users: dict[str, str], inboxes: dict[str, dict[str, list | bytearray]],
+              messages: dict[str, Email]) -> None:
     """
     Displays the main menu for the logged-in user and handles user actions.
 
@@ -387,8 +1232,9 @@ def main_menu(current_user: str, users: dict[str, str], inboxes: dict[str, dict[
 
     Args:
         current_user (str): The username of the currently logged-in user.
-        users (dict[str, str]): A dictionary of all registered users with their passwords.
-        inboxes (dict[str, dict[str, list[dict]]]): A dictionary containing all user mailboxes.
+        users (dict[str, str]): A dictionary of all registered users with their password hashes.
+        inboxes (dict[str, dict[str, list | bytearray]]): A dictionary containing all user mailboxes.
+        messages (dict[str, Email]): A dictionary of message contents keyed by message id.
 
     Returns:
         None
@@ -410,24 +1256,23 @@ def main_menu(current_user: str, users: dict[str, str], inboxes: dict[str, dict[
 
         choice = input("Enter choice (1-9): ").strip()
         if choice == '1':
-            view_inbox(current_user, inboxes)
+            view_inbox(current_user, inboxes, messages)
         elif choice == '2':
-            send_email(current_user, inboxes)
+            send_email(current_user, inboxes, messages)
         elif choice == '3':
-            view_drafts(current_user, inboxes)
+            view_drafts(current_user, inboxes, messages)
         elif choice == '4':
-            view_sent(current_user, inboxes)
+            view_sent(current_user, inboxes, messages)
         elif choice == '5':
-            delete_email(current_user, inboxes)
+            delete_email(current_user, inboxes, messages)
         elif choice == '6':
-            search_emails(current_user, inboxes)
+            search_emails(current_user, inboxes, messages)
         elif choice == '7':
             change_password(current_user, users)
         elif choice == '8':
             return
         elif choice == '9':
-            save_json(INBOX_FILE, inboxes)
-            save_json(USERS_FILE, users)
+            flush(users, inboxes, messages)
             print("\nAll data saved. Goodbye!")
             exit()
         else:
@@ -439,8 +1284,13 @@ def main():
     print("=" * 60)
     print("WELCOME TO MINIMAIL+".center(60))
     print("=" * 60)
-    users = load_json(USERS_FILE)
-    inboxes = load_json(INBOX_FILE)
+    users = {sys.intern(name): password for name, password in load_json(USERS_FILE).items()}
+    if os.path.exists(LEGACY_INBOX_FILE) and not os.path.isdir(MAILBOX_DIR):
+        import_legacy_mail(LEGACY_INBOX_FILE, LEGACY_MESSAGES_FILE)
+    messages = load_messages(MESSAGES_FILE)
+    inboxes = load_mailboxes(MAILBOX_DIR, messages)
+    # Persist pending changes even if the program is interrupted (e.g. Ctrl+C).
+    atexit.register(flush, users, inboxes, messages)
 
     while True:
         print("\nMain Menu")
@@ -455,12 +1305,12 @@ def main():
             if current_user is None:
                 continue
             ensure_user_box(current_user, inboxes)
-            main_menu(current_user, users, inboxes)
+            main_menu(current_user, users, inboxes, messages)
+            flush(users, inboxes, messages)
         elif action == '2':
             register_user(users)
         elif action == '3':
-            save_json(INBOX_FILE, inboxes)
-            save_json(USERS_FILE, users)
+            flush(users, inboxes, messages)
             print("All data saved. Goodbye!")
             break
         else: